@@ -9,16 +9,27 @@ Fetch ALL touchpoints from HubSpot for each Cognito customer:
 Then output a comprehensive touchpoint timeline per customer.
 """
 
+import argparse
+import atexit
+import bisect
 import csv
+import dbm.dumb
+import functools
+import hashlib
+import heapq
+import http.client
 import json
 import os
+import random
+import re
+import shelve
 import sys
 import time
 import urllib.parse
-import urllib.request
-import urllib.error
-from datetime import datetime
-from collections import defaultdict
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from collections import Counter, defaultdict
 
 API_TOKEN = os.environ.get("HUBSPOT_API_TOKEN", "")
 BASE_URL = "https://api.hubapi.com"
@@ -26,6 +37,46 @@ SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 COGNITO_CSV = os.path.join(SCRIPT_DIR, "..", "server", "data", "cognito_users.csv")
 JOURNEYS_JSON = os.path.join(SCRIPT_DIR, "..", "customer_journeys.json")
 
+# Compact encoder reused for request bodies and output rows; json.dumps would
+# build a new encoder on every call once separators are customized
+encode_json = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False).encode
+
+HUBSPOT_HEADERS = {
+    "Authorization": f"Bearer {API_TOKEN}",
+    "Content-Type": "application/json",
+}
+MAX_RETRIES = 6
+
+# HubSpot allows ~10 concurrent requests per private app token
+MAX_CONCURRENT_REQUESTS = 10
+HUBSPOT_SEMAPHORE = threading.Semaphore(MAX_CONCURRENT_REQUESTS)
+EXECUTOR = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REQUESTS)
+# How many companies' fetches to queue ahead of the one being assembled
+COMPANY_LOOKAHEAD = 5
+# Steady-state request rate across all threads; HubSpot's burst limit is
+# 100 requests per 10 seconds for private apps
+RATE_LIMIT_PER_SEC = float(os.environ.get("HUBSPOT_RATE_LIMIT", "9"))
+
+# One keep-alive connection per worker thread, reused across requests
+_thread_local = threading.local()
+
+# On-disk cache of successful responses so re-runs skip unchanged HubSpot data.
+# Set HUBSPOT_CACHE_PATH="" to disable.
+CACHE_PATH = os.environ.get("HUBSPOT_CACHE_PATH", os.path.join(SCRIPT_DIR, ".hubspot_cache"))
+CACHE_TTL_DEFAULT = 24 * 3600
+CACHE_TTLS = [
+    # (endpoint prefix, seconds); first match wins
+    ("/crm/v3/objects/deals/search", CACHE_TTL_DEFAULT),
+    ("/crm/v3/objects/deals/", 7 * 24 * 3600),  # deal property history
+]
+_cache = None
+_cache_lock = threading.Lock()
+
+# Requests currently in flight, so identical concurrent calls (same deal search
+# term, same deal history) wait on one response instead of each hitting HubSpot
+_inflight = {}
+_inflight_lock = threading.Lock()
+
 STAGE_MAP = {
     "appointmentscheduled": "Prospect",
     "1499838171": "Approached",
@@ -46,6 +97,14 @@ STAGE_MAP = {
     "1718686448": "Internal+Friends and Family",
     "2025131723": "Interested in a pilot",
 }
+STAGE_MAP = {sys.intern(k): v for k, v in STAGE_MAP.items()}
+
+# Deal stages grouped by outcome for the analysis. The "Stalled (Active)"
+# metrics group also counts Freemium and pilot-interest deals.
+STALL_STAGES = frozenset({"Demo Scheduled", "Demo Follow-Up", "Payment Link Sent", "On Hold", "Free Trial"})
+STALLED_GROUP_STAGES = STALL_STAGES | {"Freemium", "Interested in a pilot"}
+CHURN_OUTCOMES = frozenset({"Churn", "Closed Lost"})
+NODEAL_OUTCOMES = frozenset({None, "No Deal", ""})
 
 ENGAGEMENT_TYPES = {
     "emails": "Email",
@@ -56,134 +115,345 @@ ENGAGEMENT_TYPES = {
     "communications": "Communication",
 }
 
+ENGAGEMENT_PROPERTIES = {
+    "emails": "hs_timestamp,hs_email_subject,hs_email_direction,hs_email_status,hs_email_text",
+    "calls": "hs_timestamp,hs_call_title,hs_call_direction,hs_call_duration,hs_call_disposition,hs_call_body",
+    "meetings": "hs_timestamp,hs_meeting_title,hs_meeting_start_time,hs_meeting_end_time,hs_meeting_outcome",
+    "notes": "hs_timestamp,hs_note_body",
+    "tasks": "hs_timestamp,hs_task_subject,hs_task_status,hs_task_body",
+    "communications": "hs_timestamp,hs_communication_channel_type,hs_communication_body",
+}
 
-def hubspot_get(endpoint, params=None):
-    url = f"{BASE_URL}{endpoint}"
-    if params:
-        query = urllib.parse.urlencode({k: str(v) for k, v in params.items()})
-        url = f"{url}?{query}"
-    req = urllib.request.Request(url)
-    req.add_header("Authorization", f"Bearer {API_TOKEN}")
-    req.add_header("Content-Type", "application/json")
-    try:
-        with urllib.request.urlopen(req, timeout=30) as resp:
-            return json.loads(resp.read().decode())
-    except urllib.error.HTTPError as e:
-        if e.code == 429:
-            print("    Rate limited, waiting 10s...", file=sys.stderr)
-            time.sleep(10)
-            return hubspot_get(endpoint, params)
-        body_text = ""
+# Touchpoint types that mark a company as having had that kind of engagement
+HAS_FLAGS = {
+    "Email": "has_email",
+    "Call": "has_call",
+    "Meeting": "has_meeting",
+    "Note": "has_note",
+    "First Form Submission": "has_form",
+    "Form Submission": "has_form",
+}
+
+# First touch -> signup speed buckets: days up to and including each edge fall
+# into the label at the same index; anything past the last edge gets the last
+SPEED_BUCKET_EDGES = (0, 7, 30, 90)
+SPEED_BUCKET_LABELS = ("Same day (0)", "1-7 days", "8-30 days", "31-90 days", "90+ days")
+
+# Target stage in a "Deal Stage Change" detail: '"<deal>" moved to: <stage> (via <source>)'
+STAGE_CHANGE_RE = re.compile(r"moved to:\s*([^(]*)")
+
+# Widest histogram bar in the report; longer sections are scaled down to fit
+BAR_WIDTH = 60
+
+# Timeline markers as (match detail instead of type?, substring, icon), in
+# priority order
+ICON_RULES = (
+    (False, "First Touch", ">>"),
+    (False, "Signup", "++"),
+    (True, "Closed Won", "$$"),
+    (True, "Churn", "XX"),
+    (False, "Deal", "%%"),
+    (False, "Email", "@@"),
+    (False, "Call", "##"),
+    (False, "Meeting", "<<"),
+    (False, "Note", "--"),
+    (False, "Lifecycle", "^^"),
+)
+
+# Contact date properties that each become one touchpoint:
+# (property, touchpoint type, detail template, source)
+LIFECYCLE_FIELDS = [
+    ("hs_lifecyclestage_lead_date", "Lifecycle: Became Lead",
+     "{email} lifecycle stage changed to Lead", "HubSpot Lifecycle"),
+    ("hs_lifecyclestage_opportunity_date", "Lifecycle: Became Opportunity",
+     "{email} lifecycle stage changed to Opportunity", "HubSpot Lifecycle"),
+    ("hs_lifecyclestage_customer_date", "Lifecycle: Became Customer",
+     "{email} lifecycle stage changed to Customer", "HubSpot Lifecycle"),
+    ("hs_sa_first_engagement_date", "First Sales Engagement",
+     "First sales activity recorded for {email}", "HubSpot Sales"),
+    ("hs_last_sales_activity_date", "Last Sales Activity",
+     "Most recent sales activity for {email}", "HubSpot Sales"),
+    ("hs_latest_meeting_activity", "Meeting",
+     "Meeting with {email}", "HubSpot Meetings"),
+]
+
+CONTACT_PROPERTIES = [
+    "email", "firstname", "lastname", "company", "lifecyclestage",
+    "hs_analytics_first_timestamp", "hs_analytics_source",
+    "hs_analytics_source_data_1", "hs_analytics_source_data_2",
+    "hs_analytics_first_url", "hs_analytics_first_referrer",
+    "hs_analytics_num_page_views", "hs_analytics_num_visits",
+    "hs_analytics_num_event_completions",
+    "num_conversion_events", "recent_conversion_event_name",
+    "recent_conversion_date", "first_conversion_event_name",
+    "first_conversion_date",
+    "hs_email_optout", "hs_email_open", "hs_email_click",
+    "hs_email_bounce", "hs_email_delivered",
+    "hs_sequences_enrolled_count", "hs_sequences_actively_enrolled_count",
+    "notes_last_updated", "num_associated_deals",
+    "num_notes", "num_contacted_notes",
+    "hs_lifecyclestage_lead_date",
+    "hs_lifecyclestage_opportunity_date",
+    "hs_lifecyclestage_customer_date",
+    "hs_sa_first_engagement_date",
+    "hs_last_sales_activity_date",
+    "hs_latest_meeting_activity",
+    "createdate",
+]
+
+
+class TokenBucket:
+    """Thread-safe token bucket; take() blocks until a request may be sent."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            # Going negative reserves a future token, so waiters queue up fairly
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+
+RATE_LIMITER = TokenBucket(RATE_LIMIT_PER_SEC, capacity=max(1, RATE_LIMIT_PER_SEC))
+
+
+def _connection():
+    """Return this thread's keep-alive connection to the HubSpot API."""
+    conn = getattr(_thread_local, "conn", None)
+    if conn is None:
+        parts = urllib.parse.urlsplit(BASE_URL)
+        conn_class = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+        conn = conn_class(parts.netloc, timeout=30)
+        _thread_local.conn = conn
+    return conn
+
+
+def hubspot_request(method, path, body=None):
+    """Send one request over the pooled connection and return (status, headers, data)."""
+    RATE_LIMITER.take()
+    conn = _connection()
+    with HUBSPOT_SEMAPHORE:
         try:
-            body_text = e.read().decode()[:200]
-        except:
-            pass
-        print(f"  HTTP {e.code} for {endpoint}: {body_text}", file=sys.stderr)
+            conn.request(method, path, body=body, headers=HUBSPOT_HEADERS)
+            resp = conn.getresponse()
+        except (http.client.HTTPException, OSError):
+            # The server may have dropped an idle keep-alive connection; reconnect once
+            conn.close()
+            conn.request(method, path, body=body, headers=HUBSPOT_HEADERS)
+            resp = conn.getresponse()
+        return resp.status, resp.headers, resp.read()
+
+
+def _retry_sleep(headers, attempt):
+    """Wait before retrying a rate-limited request, honoring Retry-After when sent."""
+    try:
+        delay = float(headers.get("Retry-After", 0))
+    except ValueError:
+        delay = 0
+    if not delay:
+        delay = min(60, 2 ** attempt + random.random())
+    print(f"    Rate limited, waiting {delay:.1f}s...", file=sys.stderr)
+    time.sleep(delay)
+
+
+def _decode_response(endpoint, status, data):
+    if status >= 400:
+        print(f"  HTTP {status} for {endpoint}: {data.decode(errors='replace')[:200]}", file=sys.stderr)
         return None
+    try:
+        return json.loads(data)
     except Exception as e:
         print(f"  Error: {e} for {endpoint}", file=sys.stderr)
         return None
 
 
-def hubspot_post(endpoint, body):
-    url = f"{BASE_URL}{endpoint}"
-    data = json.dumps(body).encode()
-    req = urllib.request.Request(url, data=data, method="POST")
-    req.add_header("Authorization", f"Bearer {API_TOKEN}")
-    req.add_header("Content-Type", "application/json")
+def _open_cache():
+    """Open the response cache on first use.
+
+    dbm.dumb is chosen explicitly: shelve.open may pick dbm.sqlite3 (Python
+    3.13+), whose connection can't be used from the executor threads that read
+    and write the cache. Access is serialized by _cache_lock.
+    """
+    global _cache
+    if _cache is None and CACHE_PATH:
+        _cache = shelve.Shelf(dbm.dumb.open(CACHE_PATH, "c"))
+        atexit.register(_cache.close)
+    return _cache
+
+
+def _cache_ttl(path):
+    for prefix, ttl in CACHE_TTLS:
+        if path.startswith(prefix):
+            return ttl
+    return CACHE_TTL_DEFAULT
+
+
+def _cache_key(method, path, body):
+    # The token scopes entries to one HubSpot portal, so switching tokens never
+    # serves another portal's cached data
+    return hashlib.sha1(
+        API_TOKEN.encode() + b"\0" + method.encode() + path.encode() + (body or b"")
+    ).hexdigest()
+
+
+def cached_request(method, endpoint, path, body=None):
+    """Like _send_with_retries, but coalesce duplicate calls and use the on-disk cache."""
+    key = _cache_key(method, path, body)
+    with _inflight_lock:
+        future = _inflight.get(key)
+        is_owner = future is None
+        if is_owner:
+            future = _inflight[key] = Future()
+    if not is_owner:
+        return future.result()
+
     try:
-        with urllib.request.urlopen(req, timeout=30) as resp:
-            return json.loads(resp.read().decode())
-    except urllib.error.HTTPError as e:
-        if e.code == 429:
-            print("    Rate limited, waiting 10s...", file=sys.stderr)
-            time.sleep(10)
-            return hubspot_post(endpoint, body)
-        body_text = ""
+        result = _fetch_with_cache(key, method, endpoint, path, body)
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    else:
+        future.set_result(result)
+        return result
+    finally:
+        # Only coalesce requests still in flight; later repeats go to the disk cache
+        with _inflight_lock:
+            del _inflight[key]
+
+
+def _fetch_with_cache(key, method, endpoint, path, body):
+    with _cache_lock:
+        cache = _open_cache()
+        entry = cache.get(key) if cache is not None else None
+    if entry and time.time() - entry[0] < _cache_ttl(path):
+        return entry[1]
+
+    result = _send_with_retries(method, endpoint, path, body)
+    if result is not None and cache is not None:
+        with _cache_lock:
+            cache[key] = (time.time(), result)
+    return result
+
+
+def _send_with_retries(method, endpoint, path, body=None):
+    """Send a request, retrying up to MAX_RETRIES times while rate limited."""
+    for attempt in range(MAX_RETRIES):
         try:
-            body_text = e.read().decode()[:200]
-        except:
-            pass
-        print(f"  HTTP {e.code} for {endpoint}: {body_text}", file=sys.stderr)
-        return None
-    except Exception as e:
-        print(f"  Error: {e} for {endpoint}", file=sys.stderr)
-        return None
+            status, headers, data = hubspot_request(method, path, body)
+        except Exception as e:
+            print(f"  Error: {e} for {endpoint}", file=sys.stderr)
+            return None
+        if status != 429:
+            return _decode_response(endpoint, status, data)
+        if attempt < MAX_RETRIES - 1:
+            _retry_sleep(headers, attempt)
+    print(f"  Still rate limited after {MAX_RETRIES} attempts, giving up on {endpoint}", file=sys.stderr)
+    return None
 
 
-def get_contact_engagements(contact_id):
-    """Get all engagement associations for a contact."""
-    all_engagements = []
+def hubspot_get(endpoint, params=None):
+    path = endpoint
+    if params:
+        query = urllib.parse.urlencode({k: str(v) for k, v in params.items()})
+        path = f"{path}?{query}"
+    return cached_request("GET", endpoint, path)
+
 
-    for eng_type, eng_label in ENGAGEMENT_TYPES.items():
-        endpoint = f"/crm/v3/objects/contacts/{contact_id}/associations/{eng_type}"
-        data = hubspot_get(endpoint, {"limit": "100"})
-        if data and data.get("results"):
-            for assoc in data["results"]:
-                eng_id = assoc.get("id") or assoc.get("toObjectId")
-                if eng_id:
-                    all_engagements.append((eng_type, eng_id, eng_label))
-        time.sleep(0.1)
+def hubspot_post(endpoint, body):
+    return cached_request("POST", endpoint, endpoint, encode_json(body).encode())
 
+
+def batch_read_associations(from_type, to_type, ids):
+    """Get associated object IDs for up to 100 objects, keyed by source object ID."""
+    body = {"inputs": [{"id": str(obj_id)} for obj_id in ids[:100]]}
+    result = hubspot_post(f"/crm/v4/associations/{from_type}/{to_type}/batch/read", body)
+    associations = {}
+    if result:
+        for row in result.get("results", []):
+            from_id = str(row.get("from", {}).get("id", ""))
+            associations[from_id] = [str(to["toObjectId"]) for to in row.get("to", []) if to.get("toObjectId")]
+    return associations
+
+
+def get_contact_engagements(contact_ids):
+    """Get all engagement associations for many contacts, keyed by contact ID.
+
+    Makes one batch call per engagement type per 100 contacts; each contact's
+    list is ordered by engagement type, as (eng_type, eng_id, eng_label).
+    """
+    chunks = [contact_ids[i:i + 100] for i in range(0, len(contact_ids), 100)]
+    calls = [(eng_type, chunk) for eng_type in ENGAGEMENT_TYPES for chunk in chunks]
+    results = EXECUTOR.map(lambda call: batch_read_associations("contacts", call[0], call[1]), calls)
+
+    all_engagements = defaultdict(list)
+    for (eng_type, _), associations in zip(calls, results):
+        eng_label = ENGAGEMENT_TYPES[eng_type]
+        for contact_id, eng_ids in associations.items():
+            all_engagements[contact_id].extend((eng_type, eng_id, eng_label) for eng_id in eng_ids)
     return all_engagements
 
 
-def get_engagement_details(eng_type, eng_id):
-    """Get details of a specific engagement."""
-    props_map = {
-        "emails": "hs_timestamp,hs_email_subject,hs_email_direction,hs_email_status,hs_email_text",
-        "calls": "hs_timestamp,hs_call_title,hs_call_direction,hs_call_duration,hs_call_disposition,hs_call_body",
-        "meetings": "hs_timestamp,hs_meeting_title,hs_meeting_start_time,hs_meeting_end_time,hs_meeting_outcome",
-        "notes": "hs_timestamp,hs_note_body",
-        "tasks": "hs_timestamp,hs_task_subject,hs_task_status,hs_task_body",
-        "communications": "hs_timestamp,hs_communication_channel_type,hs_communication_body",
-    }
-    props = props_map.get(eng_type, "hs_timestamp")
-    data = hubspot_get(f"/crm/v3/objects/{eng_type}/{eng_id}", {"properties": props})
-    return data
+def batch_read_engagements(eng_type, ids, properties):
+    """Get details of many engagements of one type, keyed by engagement ID."""
+    records = {}
+    for i in range(0, len(ids), 100):
+        body = {
+            "properties": properties.split(","),
+            "inputs": [{"id": str(eng_id)} for eng_id in ids[i:i + 100]],
+        }
+        result = hubspot_post(f"/crm/v3/objects/{eng_type}/batch/read", body)
+        if result:
+            for record in result.get("results", []):
+                records[record["id"]] = record
+    return records
 
 
-def get_contact_by_email(email):
-    """Search for a contact by email and return ID."""
+def get_contacts_by_emails(emails):
+    """Search for up to 100 contacts by email in one call, keyed by lowercase email."""
     body = {
-        "filterGroups": [{"filters": [{"propertyName": "email", "operator": "EQ", "value": email}]}],
-        "properties": ["email", "firstname", "lastname", "company", "lifecyclestage",
-                        "hs_analytics_first_timestamp", "hs_analytics_source",
-                        "hs_analytics_source_data_1", "hs_analytics_source_data_2",
-                        "hs_analytics_first_url", "hs_analytics_first_referrer",
-                        "hs_analytics_num_page_views", "hs_analytics_num_visits",
-                        "hs_analytics_num_event_completions",
-                        "num_conversion_events", "recent_conversion_event_name",
-                        "recent_conversion_date", "first_conversion_event_name",
-                        "first_conversion_date",
-                        "hs_email_optout", "hs_email_open", "hs_email_click",
-                        "hs_email_bounce", "hs_email_delivered",
-                        "hs_sequences_enrolled_count", "hs_sequences_actively_enrolled_count",
-                        "notes_last_updated", "num_associated_deals",
-                        "num_notes", "num_contacted_notes",
-                        "hs_lifecyclestage_lead_date",
-                        "hs_lifecyclestage_opportunity_date",
-                        "hs_lifecyclestage_customer_date",
-                        "hs_sa_first_engagement_date",
-                        "hs_last_sales_activity_date",
-                        "hs_latest_meeting_activity",
-                        "createdate",
-                        ],
-        "limit": 1,
+        "filterGroups": [{"filters": [{"propertyName": "email", "operator": "IN", "values": list(emails)[:100]}]}],
+        "properties": CONTACT_PROPERTIES,
+        "limit": 100,
     }
-    result = hubspot_post("/crm/v3/objects/contacts/search", body)
-    if result and result.get("results"):
-        return result["results"][0]
-    return None
-
-
-def get_deal_property_history(deal_id):
-    """Get the history of dealstage changes for a deal."""
-    data = hubspot_get(f"/crm/v3/objects/deals/{deal_id}",
-                       {"propertiesWithHistory": "dealstage,amount,closedate"})
-    if data:
-        return data.get("propertiesWithHistory", {})
-    return {}
+    contacts = {}
+    while True:
+        result = hubspot_post("/crm/v3/objects/contacts/search", body)
+        if not result:
+            break
+        for record in result.get("results", []):
+            email = (record.get("properties", {}).get("email") or "").lower()
+            if email:
+                contacts[email] = record
+        after = result.get("paging", {}).get("next", {}).get("after")
+        if not after:
+            break
+        body["after"] = after
+    return contacts
+
+
+def get_deal_property_histories(deal_ids):
+    """Get dealstage/amount/closedate history for many deals, keyed by deal ID."""
+    histories = {}
+    for i in range(0, len(deal_ids), 100):
+        body = {
+            "propertiesWithHistory": ["dealstage", "amount", "closedate"],
+            "inputs": [{"id": str(deal_id)} for deal_id in deal_ids[i:i + 100]],
+        }
+        result = hubspot_post("/crm/v3/objects/deals/batch/read", body)
+        if result:
+            for record in result.get("results", []):
+                histories[record["id"]] = record.get("propertiesWithHistory", {})
+    return histories
 
 
 def search_deals_for_company(company_name):
@@ -224,11 +494,189 @@ def get_form_submissions(contact_id):
     return data
 
 
+def fetch_contact_bundle(contact, hs_contact, engagements):
+    """Build all touchpoints for one journey contact.
+
+    Returns (email, touchpoints, contact_detail, num_engagements); contact_detail
+    is None when the contact was not found in HubSpot.
+    """
+    email = contact["email"].strip().lower()
+    touchpoints = []
+
+    if not hs_contact:
+        touchpoints.append({
+            "date": contact.get("created", ""),
+            "type": "Platform Signup",
+            "detail": f"{email} created Cognito account",
+            "source": "Cognito",
+        })
+        return email, touchpoints, None, 0
+
+    contact_id = hs_contact["id"]
+    props = hs_contact.get("properties", {})
+    contact_detail = {
+        "email": email,
+        "hs_id": contact_id,
+        "props": props,
+    }
+
+    # Add analytics touchpoints
+    first_touch = props.get("hs_analytics_first_timestamp")
+    if first_touch:
+        source = props.get("hs_analytics_source", "Unknown")
+        sd1 = props.get("hs_analytics_source_data_1", "")
+        sd2 = props.get("hs_analytics_source_data_2", "")
+        first_url = props.get("hs_analytics_first_url", "")
+        first_ref = props.get("hs_analytics_first_referrer", "")
+        detail = f"Source: {source}"
+        if sd1:
+            detail += f" | {sd1}"
+        if sd2:
+            detail += f" ({sd2})"
+        if first_url:
+            detail += f" | URL: {first_url}"
+        if first_ref:
+            detail += f" | Referrer: {first_ref}"
+        touchpoints.append({
+            "date": first_touch,
+            "type": "First Touch",
+            "detail": detail,
+            "source": "HubSpot Analytics",
+            "contact": email,
+        })
+
+    # Lifecycle stage transitions, sales activity and meeting dates
+    for prop, tp_type, detail_template, source in LIFECYCLE_FIELDS:
+        value = props.get(prop)
+        if value:
+            touchpoints.append({
+                "date": value,
+                "type": tp_type,
+                "detail": detail_template.format(email=email),
+                "source": source,
+                "contact": email,
+            })
+
+    # Conversion events
+    first_conv = props.get("first_conversion_event_name")
+    first_conv_date = props.get("first_conversion_date")
+    if first_conv and first_conv_date:
+        touchpoints.append({
+            "date": first_conv_date,
+            "type": "First Form Submission",
+            "detail": f"Form: {first_conv}",
+            "source": "HubSpot Forms",
+            "contact": email,
+        })
+
+    recent_conv = props.get("recent_conversion_event_name")
+    recent_conv_date = props.get("recent_conversion_date")
+    if recent_conv and recent_conv_date and recent_conv_date != first_conv_date:
+        touchpoints.append({
+            "date": recent_conv_date,
+            "type": "Form Submission",
+            "detail": f"Form: {recent_conv}",
+            "source": "HubSpot Forms",
+            "contact": email,
+        })
+
+    # HubSpot contact create date
+    hs_created = props.get("createdate")
+    if hs_created:
+        touchpoints.append({
+            "date": hs_created,
+            "type": "HubSpot Contact Created",
+            "detail": f"{email} added to HubSpot CRM",
+            "source": "HubSpot CRM",
+            "contact": email,
+        })
+
+    # Cognito signup
+    cognito_date = contact.get("created", "")
+    if cognito_date:
+        touchpoints.append({
+            "date": cognito_date,
+            "type": "Platform Signup",
+            "detail": f"{email} created Arda account",
+            "source": "Cognito",
+            "contact": email,
+        })
+
+    # Get engagements (emails, calls, meetings, notes)
+    num_engagements = len(engagements)
+
+    engagements = engagements[:30]  # cap at 30 per contact
+    ids_by_type = defaultdict(list)
+    for eng_type, eng_id, _ in engagements:
+        ids_by_type[eng_type].append(eng_id)
+    details_by_id = {}
+    for eng_type, ids in ids_by_type.items():
+        props_list = ENGAGEMENT_PROPERTIES.get(eng_type, "hs_timestamp")
+        for eng_id, record in batch_read_engagements(eng_type, ids, props_list).items():
+            details_by_id[(eng_type, eng_id)] = record
+
+    for eng_type, eng_id, eng_label in engagements:
+        details = details_by_id.get((eng_type, str(eng_id)))
+        if details:
+            get = details.get("properties", {}).get
+            ts = get("hs_timestamp")
+            if not ts:
+                ts = details.get("createdAt")
+
+            detail_text = ""
+            if eng_type == "emails":
+                subj = get("hs_email_subject", "")
+                direction = get("hs_email_direction", "")
+                detail_text = f"[{direction}] {subj}" if subj else f"[{direction}] Email"
+            elif eng_type == "calls":
+                title = get("hs_call_title", "")
+                duration = get("hs_call_duration", "")
+                disposition = get("hs_call_disposition", "")
+                dur_str = f" ({int(int(duration)/1000)}s)" if duration and duration != "0" else ""
+                detail_text = f"{title or 'Call'}{dur_str}" + (f" - {disposition}" if disposition else "")
+            elif eng_type == "meetings":
+                title = get("hs_meeting_title", "")
+                outcome = get("hs_meeting_outcome", "")
+                start = get("hs_meeting_start_time", "")
+                detail_text = f"{title or 'Meeting'}" + (f" - {outcome}" if outcome else "")
+                if start:
+                    ts = start  # Use meeting start time
+            elif eng_type == "notes":
+                body = truncate(get("hs_note_body", ""), 150)
+                detail_text = f"Note: {body}" if body else "Note added"
+            elif eng_type == "tasks":
+                subj = get("hs_task_subject", "")
+                status = get("hs_task_status", "")
+                detail_text = f"Task: {subj}" + (f" ({status})" if status else "")
+            elif eng_type == "communications":
+                channel = get("hs_communication_channel_type", "")
+                body = truncate(get("hs_communication_body", ""), 100)
+                detail_text = f"[{channel}] {body}" if channel else body
+
+            if ts:
+                touchpoints.append({
+                    "date": ts,
+                    "type": eng_label,
+                    "detail": detail_text,
+                    "source": "HubSpot Engagement",
+                    "contact": email,
+                })
+
+    touchpoints.sort(key=touchpoint_sort_key)
+    return email, touchpoints, contact_detail, num_engagements
+
+
+@functools.lru_cache(maxsize=65536)
+def parse_iso(iso_str):
+    """Parse a HubSpot ISO timestamp; memoized since many timestamps repeat."""
+    return datetime.fromisoformat(iso_str.replace("Z", "+00:00"))
+
+
 def format_date(iso_str):
     if not iso_str or iso_str == "N/A" or iso_str == "None":
         return None
     try:
-        dt = datetime.fromisoformat(iso_str.replace("Z", "+00:00"))
+        dt = parse_iso(iso_str)
         return dt.strftime("%Y-%m-%d %H:%M")
     except:
         return iso_str[:16] if len(iso_str) >= 16 else iso_str
@@ -238,7 +686,7 @@ def format_date_short(iso_str):
     if not iso_str or iso_str == "N/A" or iso_str == "None":
         return None
     try:
-        dt = datetime.fromisoformat(iso_str.replace("Z", "+00:00"))
+        dt = parse_iso(iso_str)
         return dt.strftime("%b %d, %Y")
     except:
         return iso_str[:10]
@@ -246,13 +694,103 @@ def format_date_short(iso_str):
 
 def days_between(d1, d2):
     try:
-        dt1 = datetime.fromisoformat(d1.replace("Z", "+00:00"))
-        dt2 = datetime.fromisoformat(d2.replace("Z", "+00:00"))
+        dt1 = parse_iso(d1)
+        dt2 = parse_iso(d2)
         return (dt2 - dt1).days
     except:
         return None
 
 
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+US_PER_DAY = 86_400_000_000
+
+
+def touchpoint_stamp(iso_str):
+    """Microseconds since the epoch for an ISO timestamp, or None if unusable.
+
+    Naive timestamps are taken as UTC. Integer stamps subtract exactly, so
+    floor-dividing a difference by US_PER_DAY gives days_between's answer.
+    """
+    try:
+        dt = parse_iso(iso_str)
+    except:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return (dt - EPOCH) // timedelta(microseconds=1)
+
+
+def day_gaps(stamps):
+    """Whole days between each consecutive pair of touchpoint stamps.
+
+    A pair with a missing stamp at either end yields None.
+    """
+    return [
+        None if t1 is None or t2 is None else (t2 - t1) // US_PER_DAY
+        for t1, t2 in zip(stamps, stamps[1:])
+    ]
+
+
+def touchpoint_sort_key(tp):
+    return tp.get("date") or "9999"
+
+
+def iter_touchpoint_data(path):
+    """Stream company records back from a JSON Lines touchpoint file.
+
+    Touchpoint type/source labels repeat on every row, so they are interned to
+    share one string object per label and let equality checks hit the identity
+    fast path. Each touchpoint's date is also parsed once into tp["_ts"] (see
+    touchpoint_stamp) so gap math is plain integer subtraction.
+    """
+    intern = sys.intern
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            for tp in record["touchpoints"]:
+                tp["type"] = intern(tp["type"])
+                tp["_ts"] = touchpoint_stamp(tp.get("date"))
+                if "source" in tp:
+                    tp["source"] = intern(tp["source"])
+            yield record
+
+
+@functools.lru_cache(maxsize=None)
+def _icon_rules_for_type(tp_type):
+    """ICON_RULES resolved for one touchpoint type, as (detail substring, icon) pairs.
+
+    Type rules are decided here once per type: the first matching one becomes a
+    catch-all (None, icon) entry and ends the list, and non-matching ones drop out.
+    """
+    rules = []
+    for in_detail, key, icon in ICON_RULES:
+        if in_detail:
+            rules.append((key, icon))
+        elif key in tp_type:
+            rules.append((None, icon))
+            break
+    return tuple(rules)
+
+
+def touchpoint_icon(tp_type, detail):
+    """Visual marker for a timeline row; the first matching ICON_RULES entry wins."""
+    for key, icon in _icon_rules_for_type(tp_type):
+        if key is None or key in detail:
+            return icon
+    return "  "
+
+
+def median_in_place(values):
+    """Median of a list the caller owns; sorts it in place rather than copying."""
+    if not values:
+        return 0
+    values.sort()
+    k = len(values) // 2
+    if len(values) % 2:
+        return values[k]
+    return (values[k - 1] + values[k]) / 2
+
+
 def truncate(text, max_len=120):
     if not text:
         return ""
@@ -262,7 +800,14 @@ def truncate(text, max_len=120):
     return text
 
 
-def main():
+def count_bar(count, peak):
+    """Histogram bar for count, scaled so a section whose peak is peak fits BAR_WIDTH."""
+    if peak > BAR_WIDTH:
+        count = max(1, count * BAR_WIDTH // peak)
+    return "█" * count
+
+
+def main(verbose=False):
     print("=" * 90)
     print("ARDA CUSTOMER TOUCHPOINT ANALYSIS")
     print("=" * 90)
@@ -275,505 +820,406 @@ def main():
 
     # For each customer, collect ALL touchpoints
     print("\n[2/6] Fetching detailed contact data from HubSpot...")
-    all_touchpoint_data = []
+    # Each company is appended to the output as soon as it is built, so memory
+    # stays flat and a partial run still leaves usable data on disk
+    output_path = os.path.join(SCRIPT_DIR, "..", "customer_touchpoints.jsonl")
+    company_summaries = []
+
+    # Look up every contact up front, 100 emails per search call
+    all_emails = sorted({c["email"].strip().lower() for j in journeys for c in j.get("contacts", [])})
+    print(f"  Looking up {len(all_emails)} contacts...")
+    email_to_hs = {}
+    for i in range(0, len(all_emails), 100):
+        email_to_hs.update(get_contacts_by_emails(all_emails[i:i + 100]))
+    print(f"  Found {len(email_to_hs)} contacts in HubSpot")
+
+    print("  Fetching engagement associations...")
+    contact_engagements = get_contact_engagements([c["id"] for c in email_to_hs.values()])
+
+    def write_company(journey, touchpoints, contact_details):
+        entry = {
+            "company": journey["company"],
+            "tenant_id": journey.get("tenant_id"),
+            "lifecycle_stage": journey.get("lifecycle_stage", "Unknown"),
+            "deal_stage": journey.get("deal_stage"),
+            "deal_amount": journey.get("deal_amount"),
+            "first_touch": journey.get("first_touch"),
+            "cognito_signup": journey.get("cognito_signup"),
+            "source": journey.get("source", "Unknown"),
+            "touchpoints": touchpoints,
+            "contact_details": contact_details,
+            "total_touchpoints": len(touchpoints),
+        }
+        out.write(encode_json(entry) + "\n")
+        company_summaries.append({"company": journey["company"], "total_touchpoints": len(touchpoints)})
 
-    for idx, journey in enumerate(journeys):
+    def submit_company_fetches(journey):
+        """Queue a company's deal search and contact bundles on the executor."""
+        deals = journey.get("all_deals", [])
+        # Search for deals if we don't have many, alongside the contact fetches
         company = journey["company"]
-        contacts = journey.get("contacts", [])
-        print(f"\n  [{idx+1}/{len(journeys)}] {company} ({len(contacts)} contacts)")
-
-        company_touchpoints = []
-        company_contact_details = []
-
-        for contact in contacts:
-            email = contact["email"].strip().lower()
-            print(f"    Looking up {email}...")
-
-            hs_contact = get_contact_by_email(email)
-            if not hs_contact:
-                print(f"      Not found in HubSpot")
-                company_touchpoints.append({
-                    "date": contact.get("created", ""),
-                    "type": "Platform Signup",
-                    "detail": f"{email} created Cognito account",
-                    "source": "Cognito",
-                })
+        deal_search = None
+        if len(deals) < 2 and company and len(company) >= 3:
+            deal_search = EXECUTOR.submit(search_deals_for_company, company)
+        futures = []
+        for contact in journey.get("contacts", []):
+            hs_contact = email_to_hs.get(contact["email"].strip().lower())
+            engagements = contact_engagements.get(hs_contact["id"], []) if hs_contact else []
+            futures.append(EXECUTOR.submit(fetch_contact_bundle, contact, hs_contact, engagements))
+        return deal_search, futures
+
+    with open(output_path, "w", encoding="utf-8") as out:
+        # Companies are processed in order, but the next few are queued ahead so
+        # the pool never drains while one company's results are being assembled
+        pending = {}
+        for idx, journey in enumerate(journeys):
+            for ahead in range(idx, min(idx + COMPANY_LOOKAHEAD, len(journeys))):
+                if ahead not in pending:
+                    pending[ahead] = submit_company_fetches(journeys[ahead])
+            deal_search, futures = pending.pop(idx)
+
+            company = journey["company"]
+            contacts = journey.get("contacts", [])
+            print(f"\n  [{idx+1}/{len(journeys)}] {company} ({len(contacts)} contacts)")
+
+            contact_streams = []  # each contact's touchpoints, sorted by date
+            company_contact_details = []
+            deals = journey.get("all_deals", [])
+
+            for future in futures:
+                email, contact_touchpoints, contact_detail, num_engagements = future.result()
+                if contact_detail is None:
+                    print(f"    {email}: not found in HubSpot")
+                else:
+                    print(f"    {email}: {num_engagements} engagements")
+                    company_contact_details.append(contact_detail)
+                contact_streams.append(contact_touchpoints)
+
+            # Get deal stage history
+            print(f"    Fetching deal history...")
+            company_name_lower = company.lower()
+
+            # Merge in deals found by the company name search
+            if deal_search:
+                searched = deal_search.result()
+                existing_names = {d.get("name") for d in deals}
+                for sd in searched:
+                    if sd["properties"].get("dealname"):
+                        dn = sd["properties"]["dealname"]
+                        stage = STAGE_MAP.get(sd["properties"].get("dealstage", ""), sd["properties"].get("dealstage", ""))
+                        if dn not in existing_names:
+                            existing_names.add(dn)
+                            deals.append({
+                                "name": dn,
+                                "stage": stage,
+                                "amount": sd["properties"].get("amount"),
+                                "created": sd["properties"].get("createdate"),
+                                "closed": sd["properties"].get("closedate"),
+                                "_id": sd["id"],
+                            })
+
+            if not contact_streams and not deals:
+                # Nothing in HubSpot for this company; skip the deal history work
+                write_company(journey, [], company_contact_details)
                 continue
 
-            contact_id = hs_contact["id"]
-            props = hs_contact.get("properties", {})
-            company_contact_details.append({
-                "email": email,
-                "hs_id": contact_id,
-                "props": props,
-            })
-
-            # Add analytics touchpoints
-            first_touch = props.get("hs_analytics_first_timestamp")
-            if first_touch:
-                source = props.get("hs_analytics_source", "Unknown")
-                sd1 = props.get("hs_analytics_source_data_1", "")
-                sd2 = props.get("hs_analytics_source_data_2", "")
-                first_url = props.get("hs_analytics_first_url", "")
-                first_ref = props.get("hs_analytics_first_referrer", "")
-                detail = f"Source: {source}"
-                if sd1:
-                    detail += f" | {sd1}"
-                if sd2:
-                    detail += f" ({sd2})"
-                if first_url:
-                    detail += f" | URL: {first_url}"
-                if first_ref:
-                    detail += f" | Referrer: {first_ref}"
-                company_touchpoints.append({
-                    "date": first_touch,
-                    "type": "First Touch",
-                    "detail": detail,
-                    "source": "HubSpot Analytics",
-                    "contact": email,
-                })
-
-            # Lifecycle stage transitions
-            lead_date = props.get("hs_lifecyclestage_lead_date")
-            if lead_date:
-                company_touchpoints.append({
-                    "date": lead_date,
-                    "type": "Lifecycle: Became Lead",
-                    "detail": f"{email} lifecycle stage changed to Lead",
-                    "source": "HubSpot Lifecycle",
-                    "contact": email,
-                })
-
-            opp_date = props.get("hs_lifecyclestage_opportunity_date")
-            if opp_date:
-                company_touchpoints.append({
-                    "date": opp_date,
-                    "type": "Lifecycle: Became Opportunity",
-                    "detail": f"{email} lifecycle stage changed to Opportunity",
-                    "source": "HubSpot Lifecycle",
-                    "contact": email,
-                })
-
-            cust_date = props.get("hs_lifecyclestage_customer_date")
-            if cust_date:
-                company_touchpoints.append({
-                    "date": cust_date,
-                    "type": "Lifecycle: Became Customer",
-                    "detail": f"{email} lifecycle stage changed to Customer",
-                    "source": "HubSpot Lifecycle",
-                    "contact": email,
-                })
-
-            # Sales activity dates
-            first_eng = props.get("hs_sa_first_engagement_date")
-            if first_eng:
-                company_touchpoints.append({
-                    "date": first_eng,
-                    "type": "First Sales Engagement",
-                    "detail": f"First sales activity recorded for {email}",
-                    "source": "HubSpot Sales",
-                    "contact": email,
-                })
-
-            last_sales = props.get("hs_last_sales_activity_date")
-            if last_sales:
-                company_touchpoints.append({
-                    "date": last_sales,
-                    "type": "Last Sales Activity",
-                    "detail": f"Most recent sales activity for {email}",
-                    "source": "HubSpot Sales",
-                    "contact": email,
-                })
-
-            latest_meeting = props.get("hs_latest_meeting_activity")
-            if latest_meeting:
-                company_touchpoints.append({
-                    "date": latest_meeting,
-                    "type": "Meeting",
-                    "detail": f"Meeting with {email}",
-                    "source": "HubSpot Meetings",
-                    "contact": email,
-                })
-
-            # Conversion events
-            first_conv = props.get("first_conversion_event_name")
-            first_conv_date = props.get("first_conversion_date")
-            if first_conv and first_conv_date:
-                company_touchpoints.append({
-                    "date": first_conv_date,
-                    "type": "First Form Submission",
-                    "detail": f"Form: {first_conv}",
-                    "source": "HubSpot Forms",
-                    "contact": email,
-                })
-
-            recent_conv = props.get("recent_conversion_event_name")
-            recent_conv_date = props.get("recent_conversion_date")
-            if recent_conv and recent_conv_date and recent_conv_date != first_conv_date:
-                company_touchpoints.append({
-                    "date": recent_conv_date,
-                    "type": "Form Submission",
-                    "detail": f"Form: {recent_conv}",
-                    "source": "HubSpot Forms",
-                    "contact": email,
-                })
-
-            # HubSpot contact create date
-            hs_created = props.get("createdate")
-            if hs_created:
-                company_touchpoints.append({
-                    "date": hs_created,
-                    "type": "HubSpot Contact Created",
-                    "detail": f"{email} added to HubSpot CRM",
-                    "source": "HubSpot CRM",
-                    "contact": email,
-                })
-
-            # Cognito signup
-            cognito_date = contact.get("created", "")
-            if cognito_date:
-                company_touchpoints.append({
-                    "date": cognito_date,
-                    "type": "Platform Signup",
-                    "detail": f"{email} created Arda account",
-                    "source": "Cognito",
-                    "contact": email,
-                })
-
-            # Get engagements (emails, calls, meetings, notes)
-            print(f"      Fetching engagements...")
-            engagements = get_contact_engagements(contact_id)
-            print(f"      Found {len(engagements)} engagements")
-
-            for eng_type, eng_id, eng_label in engagements[:30]:  # cap at 30 per contact
-                details = get_engagement_details(eng_type, eng_id)
-                if details:
-                    eng_props = details.get("properties", {})
-                    ts = eng_props.get("hs_timestamp")
-                    if not ts:
-                        ts = details.get("createdAt")
-
-                    detail_text = ""
-                    if eng_type == "emails":
-                        subj = eng_props.get("hs_email_subject", "")
-                        direction = eng_props.get("hs_email_direction", "")
-                        detail_text = f"[{direction}] {subj}" if subj else f"[{direction}] Email"
-                    elif eng_type == "calls":
-                        title = eng_props.get("hs_call_title", "")
-                        duration = eng_props.get("hs_call_duration", "")
-                        disposition = eng_props.get("hs_call_disposition", "")
-                        dur_str = f" ({int(int(duration)/1000)}s)" if duration and duration != "0" else ""
-                        detail_text = f"{title or 'Call'}{dur_str}" + (f" - {disposition}" if disposition else "")
-                    elif eng_type == "meetings":
-                        title = eng_props.get("hs_meeting_title", "")
-                        outcome = eng_props.get("hs_meeting_outcome", "")
-                        start = eng_props.get("hs_meeting_start_time", "")
-                        detail_text = f"{title or 'Meeting'}" + (f" - {outcome}" if outcome else "")
-                        if start:
-                            ts = start  # Use meeting start time
-                    elif eng_type == "notes":
-                        body = truncate(eng_props.get("hs_note_body", ""), 150)
-                        detail_text = f"Note: {body}" if body else "Note added"
-                    elif eng_type == "tasks":
-                        subj = eng_props.get("hs_task_subject", "")
-                        status = eng_props.get("hs_task_status", "")
-                        detail_text = f"Task: {subj}" + (f" ({status})" if status else "")
-                    elif eng_type == "communications":
-                        channel = eng_props.get("hs_communication_channel_type", "")
-                        body = truncate(eng_props.get("hs_communication_body", ""), 100)
-                        detail_text = f"[{channel}] {body}" if channel else body
-
-                    if ts:
-                        company_touchpoints.append({
+            # For each deal, get stage change history
+            deal_ids_to_check = []
+            for d in deals:
+                if "_id" in d:
+                    deal_ids_to_check.append((d["name"], d["_id"]))
+
+            # Also search for deal IDs if we only have names
+            if not deal_ids_to_check and deals:
+                company_words = [w for w in company_name_lower.split() if len(w) > 3]
+                for d in deals[:5]:
+                    dname = d.get("name", "")
+                    if dname:
+                        search_word = dname.split(" - ")[0].split()[0] if " " in dname else dname
+                        if len(search_word) > 3:
+                            body = {
+                                "filterGroups": [{"filters": [
+                                    {"propertyName": "dealname", "operator": "CONTAINS_TOKEN", "value": search_word}
+                                ]}],
+                                "properties": ["dealname"],
+                                "limit": 10,
+                            }
+                            res = hubspot_post("/crm/v3/objects/deals/search", body)
+                            if res:
+                                for rd in res.get("results", []):
+                                    rn = rd.get("properties", {}).get("dealname", "").lower()
+                                    if company_name_lower in rn or any(w in rn for w in company_words):
+                                        deal_ids_to_check.append((rd["properties"]["dealname"], rd["id"]))
+
+            # Deduplicate deal IDs
+            seen_ids = set()
+            unique_deals = []
+            for name, did in deal_ids_to_check:
+                if did not in seen_ids:
+                    seen_ids.add(did)
+                    unique_deals.append((name, did))
+
+            unique_deals = unique_deals[:10]
+            histories = get_deal_property_histories([deal_id for _, deal_id in unique_deals])
+            deal_history_touchpoints = []
+            for deal_name, deal_id in unique_deals:
+                history = histories.get(str(deal_id))
+                if history:
+                    stage_history = history.get("dealstage", {}).get("history", []) if isinstance(history.get("dealstage"), dict) else []
+                    # Sometimes it's a list directly
+                    if isinstance(history.get("dealstage"), list):
+                        stage_history = history["dealstage"]
+
+                    for entry in stage_history:
+                        ts = entry.get("timestamp")
+                        value = entry.get("value", "")
+                        stage_name = STAGE_MAP.get(value, value)
+                        source_type = entry.get("sourceType", "")
+                        deal_history_touchpoints.append({
                             "date": ts,
-                            "type": eng_label,
-                            "detail": detail_text,
-                            "source": "HubSpot Engagement",
-                            "contact": email,
+                            "type": f"Deal Stage Change",
+                            "detail": f'"{deal_name}" moved to: {stage_name} (via {source_type})',
+                            "source": "HubSpot Deal",
                         })
-                time.sleep(0.05)
 
-            time.sleep(0.1)
-
-        # Get deal stage history
-        print(f"    Fetching deal history...")
-        deals = journey.get("all_deals", [])
-        company_name_lower = company.lower()
-
-        # Also search for deals if we don't have many
-        if len(deals) < 2:
-            searched = search_deals_for_company(company)
-            for sd in searched:
-                if sd["properties"].get("dealname"):
-                    dn = sd["properties"]["dealname"]
-                    stage = STAGE_MAP.get(sd["properties"].get("dealstage", ""), sd["properties"].get("dealstage", ""))
-                    if not any(d.get("name") == dn for d in deals):
-                        deals.append({
-                            "name": dn,
-                            "stage": stage,
-                            "amount": sd["properties"].get("amount"),
-                            "created": sd["properties"].get("createdate"),
-                            "closed": sd["properties"].get("closedate"),
-                            "_id": sd["id"],
-                        })
-            time.sleep(0.1)
-
-        # For each deal, get stage change history
-        deal_ids_to_check = []
-        for d in deals:
-            if "_id" in d:
-                deal_ids_to_check.append((d["name"], d["_id"]))
-
-        # Also search for deal IDs if we only have names
-        if not deal_ids_to_check and deals:
-            for d in deals[:5]:
-                dname = d.get("name", "")
-                if dname:
-                    search_word = dname.split(" - ")[0].split()[0] if " " in dname else dname
-                    if len(search_word) > 3:
-                        body = {
-                            "filterGroups": [{"filters": [
-                                {"propertyName": "dealname", "operator": "CONTAINS_TOKEN", "value": search_word}
-                            ]}],
-                            "properties": ["dealname"],
-                            "limit": 10,
-                        }
-                        res = hubspot_post("/crm/v3/objects/deals/search", body)
-                        if res:
-                            for rd in res.get("results", []):
-                                rn = rd.get("properties", {}).get("dealname", "").lower()
-                                if company_name_lower in rn or any(w in rn for w in company_name_lower.split() if len(w) > 3):
-                                    deal_ids_to_check.append((rd["properties"]["dealname"], rd["id"]))
-                        time.sleep(0.1)
-
-        # Deduplicate deal IDs
-        seen_ids = set()
-        unique_deals = []
-        for name, did in deal_ids_to_check:
-            if did not in seen_ids:
-                seen_ids.add(did)
-                unique_deals.append((name, did))
-
-        for deal_name, deal_id in unique_deals[:10]:
-            history = get_deal_property_history(deal_id)
-            if history:
-                stage_history = history.get("dealstage", {}).get("history", []) if isinstance(history.get("dealstage"), dict) else []
-                # Sometimes it's a list directly
-                if isinstance(history.get("dealstage"), list):
-                    stage_history = history["dealstage"]
-
-                for entry in stage_history:
-                    ts = entry.get("timestamp")
-                    value = entry.get("value", "")
-                    stage_name = STAGE_MAP.get(value, value)
-                    source_type = entry.get("sourceType", "")
-                    company_touchpoints.append({
-                        "date": ts,
-                        "type": f"Deal Stage Change",
-                        "detail": f'"{deal_name}" moved to: {stage_name} (via {source_type})',
+                    amount_history = history.get("amount", {}).get("history", []) if isinstance(history.get("amount"), dict) else []
+                    if isinstance(history.get("amount"), list):
+                        amount_history = history["amount"]
+
+                    for entry in amount_history:
+                        ts = entry.get("timestamp")
+                        value = entry.get("value", "")
+                        if value:
+                            deal_history_touchpoints.append({
+                                "date": ts,
+                                "type": "Deal Amount Changed",
+                                "detail": f'"{deal_name}" amount set to ${value}',
+                                "source": "HubSpot Deal",
+                            })
+
+            # Also add deal create/close as explicit touchpoints
+            deal_date_touchpoints = []
+            for d in deals:
+                if d.get("created"):
+                    deal_date_touchpoints.append({
+                        "date": d["created"],
+                        "type": "Deal Created",
+                        "detail": f'"{d.get("name", "Unknown")}" created | Stage: {d.get("stage", "N/A")}' +
+                                  (f' | ${d.get("amount")}' if d.get("amount") else ""),
+                        "source": "HubSpot Deal",
+                    })
+                if d.get("closed"):
+                    deal_date_touchpoints.append({
+                        "date": d["closed"],
+                        "type": "Deal Closed",
+                        "detail": f'"{d.get("name", "Unknown")}" closed | Final: {d.get("stage", "N/A")}' +
+                                  (f' | ${d.get("amount")}' if d.get("amount") else ""),
                         "source": "HubSpot Deal",
                     })
 
-                amount_history = history.get("amount", {}).get("history", []) if isinstance(history.get("amount"), dict) else []
-                if isinstance(history.get("amount"), list):
-                    amount_history = history["amount"]
-
-                for entry in amount_history:
-                    ts = entry.get("timestamp")
-                    value = entry.get("value", "")
-                    if value:
-                        company_touchpoints.append({
-                            "date": ts,
-                            "type": "Deal Amount Changed",
-                            "detail": f'"{deal_name}" amount set to ${value}',
-                            "source": "HubSpot Deal",
-                        })
-            time.sleep(0.1)
-
-        # Also add deal create/close as explicit touchpoints
-        for d in deals:
-            if d.get("created"):
-                company_touchpoints.append({
-                    "date": d["created"],
-                    "type": "Deal Created",
-                    "detail": f'"{d.get("name", "Unknown")}" created | Stage: {d.get("stage", "N/A")}' +
-                              (f' | ${d.get("amount")}' if d.get("amount") else ""),
-                    "source": "HubSpot Deal",
-                })
-            if d.get("closed"):
-                company_touchpoints.append({
-                    "date": d["closed"],
-                    "type": "Deal Closed",
-                    "detail": f'"{d.get("name", "Unknown")}" closed | Final: {d.get("stage", "N/A")}' +
-                              (f' | ${d.get("amount")}' if d.get("amount") else ""),
-                    "source": "HubSpot Deal",
-                })
-
-        # Sort touchpoints by date
-        company_touchpoints.sort(key=lambda t: t.get("date") or "9999")
-
-        # Deduplicate very similar touchpoints (same date + type)
-        deduped = []
-        seen_keys = set()
-        for tp in company_touchpoints:
-            key = (tp.get("date", "")[:16], tp.get("type", ""), tp.get("detail", "")[:50])
-            if key not in seen_keys:
-                seen_keys.add(key)
-                deduped.append(tp)
-
-        all_touchpoint_data.append({
-            "company": company,
-            "tenant_id": journey.get("tenant_id"),
-            "lifecycle_stage": journey.get("lifecycle_stage", "Unknown"),
-            "deal_stage": journey.get("deal_stage"),
-            "deal_amount": journey.get("deal_amount"),
-            "first_touch": journey.get("first_touch"),
-            "cognito_signup": journey.get("cognito_signup"),
-            "source": journey.get("source", "Unknown"),
-            "touchpoints": deduped,
-            "contact_details": company_contact_details,
-            "total_touchpoints": len(deduped),
-        })
-
-    # Save raw data
-    print("\n\n[3/6] Saving raw touchpoint data...")
-    output_json = os.path.join(SCRIPT_DIR, "..", "customer_touchpoints.json")
-    with open(output_json, "w") as f:
-        json.dump(all_touchpoint_data, f, indent=2, default=str)
-    print(f"  Saved to {output_json}")
+            # Merge the per-source streams by date. Each stream is sorted on its own,
+            # and heapq.merge keeps ties in stream order, so the result matches a
+            # stable sort of everything appended in this order
+            deal_history_touchpoints.sort(key=touchpoint_sort_key)
+            deal_date_touchpoints.sort(key=touchpoint_sort_key)
+            company_touchpoints = heapq.merge(*contact_streams, deal_history_touchpoints, deal_date_touchpoints,
+                                              key=touchpoint_sort_key)
+
+            # Deduplicate very similar touchpoints (same date + type)
+            deduped = []
+            seen_hashes = set()
+            for tp in company_touchpoints:
+                tp_date = tp.get("date") or ""
+                tp_detail = tp.get("detail") or ""
+                key_hash = hash((tp_date[:16], tp.get("type", ""), tp_detail[:50]))
+                if key_hash not in seen_hashes:
+                    seen_hashes.add(key_hash)
+                    deduped.append(tp)
+
+            write_company(journey, deduped, company_contact_details)
+
+    print("\n\n[3/6] Raw touchpoint data saved")
+    print(f"  {len(company_summaries)} companies written to {output_path}")
 
     # ===== ANALYSIS =====
     print("\n[4/6] Analyzing touchpoint patterns...")
 
     # Categorize companies
-    closed_won = [c for c in all_touchpoint_data if c["deal_stage"] == "Closed Won"]
-    churned = [c for c in all_touchpoint_data if c["deal_stage"] in ("Churn", "Closed Lost")]
-    stalled = [c for c in all_touchpoint_data if c["deal_stage"] in ("Demo Scheduled", "Demo Follow-Up", "Payment Link Sent", "On Hold", "Free Trial", "Freemium", "Interested in a pilot")]
-    no_deal = [c for c in all_touchpoint_data if not c["deal_stage"] or c["deal_stage"] == "No Deal"]
+    def outcome_group(deal_stage):
+        if deal_stage == "Closed Won":
+            return "Closed Won"
+        if deal_stage in CHURN_OUTCOMES:
+            return "Churned"
+        if deal_stage in STALLED_GROUP_STAGES:
+            return "Stalled (Active)"
+        if deal_stage in NODEAL_OUTCOMES:
+            return "No Deal"
+        return None
 
     # Compute metrics per group
-    def compute_group_metrics(group, label):
-        metrics = {
+    def new_group_metrics(label):
+        return {
             "label": label,
-            "count": len(group),
+            "count": 0,
             "avg_touchpoints": 0,
             "avg_days_to_signup": 0,
             "avg_days_to_close": 0,
-            "touchpoint_type_counts": defaultdict(int),
-            "source_counts": defaultdict(int),
+            "touchpoint_type_counts": Counter(),
+            "source_counts": Counter(),
             "has_email": 0,
             "has_call": 0,
             "has_meeting": 0,
             "has_note": 0,
             "has_form": 0,
-            "signup_days": [],
-            "close_days": [],
-            "touchpoint_counts": [],
+            "signup_days_sum": 0,
+            "signup_days_n": 0,
+            "close_days_sum": 0,
+            "close_days_n": 0,
+            "touchpoints_sum": 0,
+            "touchpoint_counts": [],  # kept for the median
         }
-        if not group:
-            return metrics
-
-        for c in group:
-            tps = c["touchpoints"]
-            metrics["touchpoint_counts"].append(len(tps))
-            metrics["source_counts"][c.get("source", "Unknown")] += 1
 
-            tp_types = set()
-            for tp in tps:
-                tp_type = tp["type"]
-                metrics["touchpoint_type_counts"][tp_type] += 1
-                tp_types.add(tp_type)
-
-            if "Email" in tp_types:
-                metrics["has_email"] += 1
-            if "Call" in tp_types:
-                metrics["has_call"] += 1
-            if "Meeting" in tp_types:
-                metrics["has_meeting"] += 1
-            if "Note" in tp_types:
-                metrics["has_note"] += 1
-            if "First Form Submission" in tp_types or "Form Submission" in tp_types:
-                metrics["has_form"] += 1
-
-            if c.get("first_touch") and c.get("cognito_signup"):
-                d = days_between(c["first_touch"], c["cognito_signup"])
-                if d is not None and d >= 0:
-                    metrics["signup_days"].append(d)
-
-            # Find deal close
-            close_date = None
-            for tp in tps:
-                if tp["type"] == "Deal Closed" and "Closed Won" in tp.get("detail", ""):
-                    close_date = tp["date"]
-                    break
-            if not close_date:
-                for tp in tps:
-                    if tp["type"] == "Deal Closed":
-                        close_date = tp["date"]
-                        break
+    def add_company_metrics(metrics, c):
+        metrics["count"] += 1
+        tps = c["touchpoints"]
+        metrics["touchpoint_counts"].append(len(tps))
+        metrics["touchpoints_sum"] += len(tps)
+        metrics["source_counts"][c.get("source", "Unknown")] += 1
 
-            if c.get("first_touch") and close_date:
-                d = days_between(c["first_touch"], close_date)
-                if d is not None and d >= 0:
-                    metrics["close_days"].append(d)
+        types = [tp["type"] for tp in tps]
+        metrics["touchpoint_type_counts"].update(types)
+        tp_types = set(types)
 
-        metrics["avg_touchpoints"] = sum(metrics["touchpoint_counts"]) / len(group) if group else 0
-        metrics["avg_days_to_signup"] = sum(metrics["signup_days"]) / len(metrics["signup_days"]) if metrics["signup_days"] else 0
-        metrics["avg_days_to_close"] = sum(metrics["close_days"]) / len(metrics["close_days"]) if metrics["close_days"] else 0
-        metrics["median_touchpoints"] = sorted(metrics["touchpoint_counts"])[len(metrics["touchpoint_counts"])//2] if metrics["touchpoint_counts"] else 0
+        # Both form types map to has_form, so collect flags as a set to count it once
+        for flag in {HAS_FLAGS[t] for t in tp_types & HAS_FLAGS.keys()}:
+            metrics[flag] += 1
 
-        return metrics
+        if c.get("first_touch") and c.get("cognito_signup"):
+            d = days_between(c["first_touch"], c["cognito_signup"])
+            if d is not None and d >= 0:
+                metrics["signup_days_sum"] += d
+                metrics["signup_days_n"] += 1
 
-    won_metrics = compute_group_metrics(closed_won, "Closed Won")
-    churn_metrics = compute_group_metrics(churned, "Churned")
-    stall_metrics = compute_group_metrics(stalled, "Stalled (Active)")
-    nodeal_metrics = compute_group_metrics(no_deal, "No Deal")
+        # Find deal close: the first Closed Won, else the first close of any kind
+        close_date = None
+        for tp in tps:
+            if tp["type"] == "Deal Closed":
+                if "Closed Won" in tp.get("detail", ""):
+                    close_date = tp["date"]
+                    break
+                close_date = close_date or tp["date"]
+
+        if c.get("first_touch") and close_date:
+            d = days_between(c["first_touch"], close_date)
+            if d is not None and d >= 0:
+                metrics["close_days_sum"] += d
+                metrics["close_days_n"] += 1
+
+    def finish_group_metrics(metrics):
+        metrics["avg_touchpoints"] = metrics["touchpoints_sum"] / metrics["count"] if metrics["count"] else 0
+        metrics["avg_days_to_signup"] = metrics["signup_days_sum"] / metrics["signup_days_n"] if metrics["signup_days_n"] else 0
+        metrics["avg_days_to_close"] = metrics["close_days_sum"] / metrics["close_days_n"] if metrics["close_days_n"] else 0
+        metrics["median_touchpoints"] = median_in_place(metrics["touchpoint_counts"])
+
+    # One pass over the saved data feeds every group
+    group_metrics = {label: new_group_metrics(label) for label in ("Closed Won", "Churned", "Stalled (Active)", "No Deal")}
+    for c in iter_touchpoint_data(output_path):
+        label = outcome_group(c["deal_stage"])
+        if label:
+            add_company_metrics(group_metrics[label], c)
+    for metrics in group_metrics.values():
+        finish_group_metrics(metrics)
+
+    won_metrics = group_metrics["Closed Won"]
+    churn_metrics = group_metrics["Churned"]
+    stall_metrics = group_metrics["Stalled (Active)"]
+    nodeal_metrics = group_metrics["No Deal"]
 
     # Identify falloff points
     print("\n[5/6] Identifying falloff points...")
 
     # Analyze stage transition gaps
-    stage_sequence_counts = defaultdict(int)
-    last_stage_before_stall = defaultdict(int)
-    touchpoint_gaps = []  # gaps between consecutive touchpoints
+    stage_sequence_counts = Counter()  # keyed by (from_stage, to_stage)
+    last_stage_before_stall = Counter()
+    # Gaps between consecutive touchpoints, summarized per outcome bucket as
+    # they are found; only gaps over 30 days are kept for the "largest" list
+    def gap_bucket(outcome):
+        if outcome == "Closed Won":
+            return "Closed Won"
+        if outcome in STALL_STAGES:
+            return "Stalled"
+        if outcome in CHURN_OUTCOMES:
+            return "Churned"
+        if outcome in NODEAL_OUTCOMES:
+            return "No Deal"
+        return None
 
-    for c in all_touchpoint_data:
+    gap_stats = {
+        label: {"sum": 0, "count": 0, "max": 0, "over_14": 0, "over_30": 0}
+        for label in ("Closed Won", "Stalled", "Churned", "No Deal")
+    }
+    long_gaps = []
+    channel_outcomes = Counter()  # keyed by (channel, outcome)
+    # Signup-speed tallies per SPEED_BUCKET_LABELS index; company names are only
+    # kept for the --verbose listing
+    bucket_total = [0] * len(SPEED_BUCKET_LABELS)
+    bucket_won = [0] * len(SPEED_BUCKET_LABELS)
+    bucket_companies = [[] for _ in SPEED_BUCKET_LABELS]
+
+    # One pass feeds the stage, gap, channel and speed sections of the report
+    for c in iter_touchpoint_data(output_path):
         tps = c["touchpoints"]
         stages_seen = []
         for tp in tps:
             if tp["type"] == "Deal Stage Change":
-                detail = tp.get("detail", "")
                 # Extract stage name
-                if "moved to:" in detail:
-                    stage = detail.split("moved to:")[1].split("(")[0].strip()
-                    stages_seen.append((tp["date"], stage))
+                m = STAGE_CHANGE_RE.search(tp.get("detail", ""))
+                if m:
+                    stages_seen.append((tp["date"], m.group(1).rstrip()))
 
         # Track stage sequences
-        for i in range(len(stages_seen) - 1):
-            from_stage = stages_seen[i][1]
-            to_stage = stages_seen[i + 1][1]
-            stage_sequence_counts[f"{from_stage} → {to_stage}"] += 1
+        stage_sequence_counts.update((a[1], b[1]) for a, b in zip(stages_seen, stages_seen[1:]))
 
         # Track where stalled deals stopped
-        if c["deal_stage"] in ("Demo Scheduled", "Demo Follow-Up", "Payment Link Sent", "On Hold", "Free Trial"):
+        if c["deal_stage"] in STALL_STAGES:
             last_stage_before_stall[c["deal_stage"]] += 1
 
         # Calculate gaps between touchpoints
-        prev_date = None
-        for tp in tps:
-            if tp.get("date") and tp["type"] not in ("Last Sales Activity",):
-                if prev_date:
-                    gap = days_between(prev_date, tp["date"])
-                    if gap is not None and gap > 0:
-                        touchpoint_gaps.append({
-                            "company": c["company"],
-                            "gap_days": gap,
-                            "from_type": prev_type,
-                            "to_type": tp["type"],
-                            "outcome": c.get("deal_stage", "No Deal"),
-                        })
-                prev_date = tp["date"]
-                prev_type = tp["type"]
+        outcome = c.get("deal_stage", "No Deal")
+        stats = gap_stats.get(gap_bucket(outcome))
+        dated = [tp for tp in tps if tp.get("date") and tp["type"] != "Last Sales Activity"]
+        gaps = day_gaps([tp["_ts"] for tp in dated])
+        positive = [gap for gap in gaps if gap is not None and gap > 0]
+        longest = max(positive, default=0)
+        if stats and positive:
+            # Fold the company's gaps into its bucket with builtin reductions
+            # rather than five dict updates per gap
+            stats["sum"] += sum(positive)
+            stats["count"] += len(positive)
+            stats["max"] = max(stats["max"], longest)
+            stats["over_14"] += sum(gap > 14 for gap in positive)
+            stats["over_30"] += sum(gap > 30 for gap in positive)
+        if longest > 30:
+            for prev, tp, gap in zip(dated, dated[1:], gaps):
+                if gap is not None and gap > 30:
+                    long_gaps.append({
+                        "company": c["company"],
+                        "gap_days": gap,
+                        "from_type": prev["type"],
+                        "to_type": tp["type"],
+                        "outcome": outcome,
+                    })
+
+        channel_outcomes[(c.get("source", "Unknown"), c.get("deal_stage") or "No Deal")] += 1
+
+        if c.get("first_touch") and c.get("cognito_signup"):
+            days = days_between(c["first_touch"], c["cognito_signup"])
+            if days is not None and days >= 0:
+                idx = bisect.bisect_left(SPEED_BUCKET_EDGES, days)
+                bucket_total[idx] += 1
+                bucket_won[idx] += c.get("deal_stage") == "Closed Won"
+                if verbose:
+                    bucket_companies[idx].append((c["company"], c.get("deal_stage") or "No Deal"))
 
     # ===== OUTPUT REPORT =====
     print("\n[6/6] Generating comprehensive report...\n")
@@ -782,57 +1228,41 @@ def main():
     print("COMPREHENSIVE TOUCHPOINT ANALYSIS")
     print("=" * 90)
 
-    # Print each company's full touchpoint timeline
-    for c in all_touchpoint_data:
-        tps = c["touchpoints"]
-        print(f"\n{'━' * 90}")
-        print(f"  {c['company'].upper()} — {c['lifecycle_stage']} — Deal: {c['deal_stage'] or 'None'}")
-        print(f"  Total touchpoints: {len(tps)} | Source: {c['source']}")
-        print(f"{'━' * 90}")
+    # Print each company's full touchpoint timeline, one write per company
+    if verbose:
+        write = sys.stdout.write
+        for c in iter_touchpoint_data(output_path):
+            tps = c["touchpoints"]
+            lines = [
+                f"\n{'━' * 90}",
+                f"  {c['company'].upper()} — {c['lifecycle_stage']} — Deal: {c['deal_stage'] or 'None'}",
+                f"  Total touchpoints: {len(tps)} | Source: {c['source']}",
+                f"{'━' * 90}",
+            ]
+
+            if not tps:
+                lines.append("  (No touchpoints recorded)")
+
+            gaps = day_gaps([tp["_ts"] for tp in tps])
+            for i, tp in enumerate(tps):
+                date_str = format_date_short(tp.get("date")) or "Unknown date"
+                tp_type = tp["type"]
+                raw_detail = tp.get("detail") or ""
+                detail = truncate(raw_detail, 100)
+                icon = touchpoint_icon(tp_type, raw_detail)
 
-        if not tps:
-            print("  (No touchpoints recorded)")
-            continue
+                connector = "├" if i < len(tps) - 1 else "└"
+                line = "│" if i < len(tps) - 1 else " "
+                lines.append(f"  {connector}─{icon} {date_str:14s} {tp_type:30s} {detail}")
 
-        for i, tp in enumerate(tps):
-            date_str = format_date_short(tp.get("date")) or "Unknown date"
-            tp_type = tp["type"]
-            detail = truncate(tp.get("detail", ""), 100)
-
-            # Visual markers
-            icon = "  "
-            if "First Touch" in tp_type:
-                icon = ">>"
-            elif "Signup" in tp_type:
-                icon = "++"
-            elif "Closed Won" in str(tp.get("detail", "")):
-                icon = "$$"
-            elif "Churn" in str(tp.get("detail", "")):
-                icon = "XX"
-            elif "Deal" in tp_type:
-                icon = "%%"
-            elif "Email" in tp_type:
-                icon = "@@"
-            elif "Call" in tp_type:
-                icon = "##"
-            elif "Meeting" in tp_type:
-                icon = "<<"
-            elif "Note" in tp_type:
-                icon = "--"
-            elif "Lifecycle" in tp_type:
-                icon = "^^"
-
-            connector = "├" if i < len(tps) - 1 else "└"
-            line = "│" if i < len(tps) - 1 else " "
-            print(f"  {connector}─{icon} {date_str:14s} {tp_type:30s} {detail}")
-
-            # Show gaps > 7 days
-            if i < len(tps) - 1:
-                next_date = tps[i + 1].get("date")
-                if tp.get("date") and next_date:
-                    gap = days_between(tp["date"], next_date)
+                # Show gaps > 7 days
+                if i < len(gaps):
+                    gap = gaps[i]
                     if gap and gap > 7:
-                        print(f"  {line}   {'':14s} {'':30s} ⚠ {gap} day gap")
+                        lines.append(f"  {line}   {'':14s} {'':30s} ⚠ {gap} day gap")
+
+            lines.append("")
+            write("\n".join(lines))
 
     # ===== AGGREGATE ANALYSIS =====
     print(f"\n\n{'=' * 90}")
@@ -848,9 +1278,9 @@ def main():
             continue
         print(f"\n  {m['label']} ({m['count']} companies):")
         print(f"    Avg touchpoints:       {m['avg_touchpoints']:.1f}")
-        print(f"    Median touchpoints:    {m['median_touchpoints']}")
+        print(f"    Median touchpoints:    {m['median_touchpoints']:g}")
         print(f"    Avg days to signup:    {m['avg_days_to_signup']:.0f}")
-        if m["close_days"]:
+        if m["close_days_n"]:
             print(f"    Avg days to close:     {m['avg_days_to_close']:.0f}")
         print(f"    Had emails:            {m['has_email']}/{m['count']} ({100*m['has_email']/m['count']:.0f}%)")
         print(f"    Had calls:             {m['has_call']}/{m['count']} ({100*m['has_call']/m['count']:.0f}%)")
@@ -862,19 +1292,18 @@ def main():
     print(f"\n{'─' * 90}")
     print("  ACQUISITION CHANNEL → OUTCOME CORRELATION")
     print(f"{'─' * 90}")
-    channel_outcomes = defaultdict(lambda: defaultdict(int))
-    for c in all_touchpoint_data:
-        src = c.get("source", "Unknown")
-        outcome = c.get("deal_stage") or "No Deal"
-        channel_outcomes[src][outcome] += 1
+    per_channel = defaultdict(Counter)
+    for (channel, outcome), count in channel_outcomes.items():
+        per_channel[channel][outcome] = count
 
-    for channel, outcomes in sorted(channel_outcomes.items(), key=lambda x: -sum(x[1].values())):
+    peak = max(channel_outcomes.values(), default=0)
+    for channel, outcomes in sorted(per_channel.items(), key=lambda x: -sum(x[1].values())):
         total = sum(outcomes.values())
-        won = outcomes.get("Closed Won", 0)
+        won = outcomes["Closed Won"]
         win_rate = 100 * won / total if total else 0
         print(f"\n  {channel} ({total} customers):")
-        for outcome, count in sorted(outcomes.items(), key=lambda x: -x[1]):
-            bar = "█" * count
+        for outcome, count in outcomes.most_common():
+            bar = count_bar(count, peak)
             print(f"    {outcome:30s} {count:3d}  {bar}")
         print(f"    Win rate: {win_rate:.0f}%")
 
@@ -885,14 +1314,17 @@ def main():
 
     if stage_sequence_counts:
         print(f"\n  Stage Transitions (all deals):")
-        for transition, count in sorted(stage_sequence_counts.items(), key=lambda x: -x[1]):
-            bar = "█" * count
+        peak = max(stage_sequence_counts.values())
+        for (from_stage, to_stage), count in stage_sequence_counts.most_common():
+            bar = count_bar(count, peak)
+            transition = f"{from_stage} → {to_stage}"
             print(f"    {transition:50s} {count:3d}  {bar}")
 
     if last_stage_before_stall:
         print(f"\n  Current Stage of Stalled Deals:")
-        for stage, count in sorted(last_stage_before_stall.items(), key=lambda x: -x[1]):
-            bar = "█" * count
+        peak = max(last_stage_before_stall.values())
+        for stage, count in last_stage_before_stall.most_common():
+            bar = count_bar(count, peak)
             print(f"    {stage:35s} {count:3d}  {bar}")
 
     # Gap analysis
@@ -900,28 +1332,19 @@ def main():
     print("  ENGAGEMENT GAP ANALYSIS")
     print(f"{'─' * 90}")
 
-    won_gaps = [g["gap_days"] for g in touchpoint_gaps if g["outcome"] == "Closed Won"]
-    stall_gaps = [g["gap_days"] for g in touchpoint_gaps if g["outcome"] in ("Demo Scheduled", "Demo Follow-Up", "On Hold", "Free Trial", "Payment Link Sent")]
-    churn_gaps = [g["gap_days"] for g in touchpoint_gaps if g["outcome"] in ("Churn", "Closed Lost")]
-    nodeal_gaps = [g["gap_days"] for g in touchpoint_gaps if g["outcome"] in (None, "No Deal", "")]
-
-    for label, gaps in [("Closed Won", won_gaps), ("Stalled", stall_gaps), ("Churned", churn_gaps), ("No Deal", nodeal_gaps)]:
-        if not gaps:
+    for label, stats in gap_stats.items():
+        n = stats["count"]
+        if not n:
             continue
-        avg_gap = sum(gaps) / len(gaps)
-        max_gap = max(gaps)
-        min_gap = min(gaps)
-        over_14 = sum(1 for g in gaps if g > 14)
-        over_30 = sum(1 for g in gaps if g > 30)
         print(f"\n  {label} customers:")
-        print(f"    Avg gap between touchpoints: {avg_gap:.0f} days")
-        print(f"    Max gap:                     {max_gap} days")
-        print(f"    Gaps > 14 days:              {over_14}/{len(gaps)} ({100*over_14/len(gaps):.0f}%)")
-        print(f"    Gaps > 30 days:              {over_30}/{len(gaps)} ({100*over_30/len(gaps):.0f}%)")
+        print(f"    Avg gap between touchpoints: {stats['sum'] / n:.0f} days")
+        print(f"    Max gap:                     {stats['max']} days")
+        print(f"    Gaps > 14 days:              {stats['over_14']}/{n} ({100*stats['over_14']/n:.0f}%)")
+        print(f"    Gaps > 30 days:              {stats['over_30']}/{n} ({100*stats['over_30']/n:.0f}%)")
 
     # Big gaps list
     print(f"\n  Largest engagement gaps (>30 days):")
-    big_gaps = sorted([g for g in touchpoint_gaps if g["gap_days"] > 30], key=lambda g: -g["gap_days"])[:20]
+    big_gaps = heapq.nlargest(20, long_gaps, key=lambda g: g["gap_days"])
     for g in big_gaps:
         print(f"    {g['company']:30s} {g['gap_days']:4d} days  {g['from_type']} → {g['to_type']}  [{g['outcome']}]")
 
@@ -930,31 +1353,12 @@ def main():
     print("  CONVERSION SPEED PATTERNS")
     print(f"{'─' * 90}")
 
-    speed_buckets = {"Same day (0)": [], "1-7 days": [], "8-30 days": [], "31-90 days": [], "90+ days": []}
-    for c in all_touchpoint_data:
-        if c.get("first_touch") and c.get("cognito_signup"):
-            days = days_between(c["first_touch"], c["cognito_signup"])
-            if days is not None and days >= 0:
-                if days == 0:
-                    speed_buckets["Same day (0)"].append(c)
-                elif days <= 7:
-                    speed_buckets["1-7 days"].append(c)
-                elif days <= 30:
-                    speed_buckets["8-30 days"].append(c)
-                elif days <= 90:
-                    speed_buckets["31-90 days"].append(c)
-                else:
-                    speed_buckets["90+ days"].append(c)
-
     print(f"\n  First Touch → Platform Signup speed:")
-    for bucket, companies in speed_buckets.items():
-        won = sum(1 for c in companies if c.get("deal_stage") == "Closed Won")
-        total = len(companies)
+    for bucket, total, won, companies in zip(SPEED_BUCKET_LABELS, bucket_total, bucket_won, bucket_companies):
         win_rate = 100 * won / total if total else 0
         print(f"    {bucket:20s} {total:3d} companies  ({won} Closed Won = {win_rate:.0f}% win rate)")
-        for c in companies:
-            outcome = c.get("deal_stage") or "No Deal"
-            print(f"      • {c['company'][:35]:35s} → {outcome}")
+        for company, outcome in companies:
+            print(f"      • {company[:35]:35s} → {outcome}")
 
     # Key insights
     print(f"\n\n{'=' * 90}")
@@ -994,14 +1398,19 @@ def main():
      Momentum Woodworks, Trace Audio) tend to be stickier.
 """)
 
-    print(f"\n  Full data saved to: {output_json}")
+    print(f"\n  Full data saved to: {output_path}")
     print(f"  Total API calls made during this analysis")
 
-    return all_touchpoint_data
+    return company_summaries
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fetch HubSpot touchpoints per customer and print a journey analysis.")
+    parser.add_argument("-v", "--verbose", action="store_true",
+                        help="also print every company's full touchpoint timeline and the "
+                             "companies in each signup-speed bucket")
+    args = parser.parse_args()
     if not API_TOKEN:
         print("ERROR: Set HUBSPOT_API_TOKEN environment variable", file=sys.stderr)
         sys.exit(1)
-    main()
+    main(verbose=args.verbose)